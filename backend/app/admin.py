@@ -14,6 +14,7 @@ from typing import Dict, List, Any, Optional
 import json
 import os
 import logging
+from functools import lru_cache
 from .prompts import (
     load_system_prompt,
     save_system_prompt,
@@ -27,12 +28,12 @@ from .prompts import (
 from fastapi import UploadFile
 from fastapi import File as FastFile
 from fastapi.staticfiles import StaticFiles
-from .topic_router import refresh_routes_cache
+from .topic_router import refresh_routes_cache, compile_pattern
 from .rag import refresh_files_cache
 from .usage import read_usage, usage_stats, reset_usage, query_usage
 from .memory import get_memory
 from .transcribe import whisper_service
-from .auth import AuthManager, get_current_admin_user
+from .auth import AuthManager, get_current_admin_user, invalidate_user_cache
 from pathlib import Path
 import re
 import bcrypt
@@ -208,7 +209,9 @@ def save_config(config: dict):
     os.makedirs(os.path.dirname(config_file), exist_ok=True)
     with open(config_file, 'w', encoding='utf-8') as f:
         json.dump(config, f, indent=2, ensure_ascii=False)
+    get_summary_provider.cache_clear()
 
+@lru_cache(maxsize=1)
 def get_summary_provider():
     """Ottiene il provider configurato per i summary (mai 'local')"""
     config = load_config()
@@ -1330,13 +1333,14 @@ async def download_interactions_log(date: Optional[str] = None):
 
 
 # ---- Avatar upload/list ----
+AVATAR_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".webp"})
+
 @router.post("/admin/avatars/upload")
 async def upload_avatar(file: UploadFile = FastFile(...)):
     try:
-        allowed = {".png", ".jpg", ".jpeg", ".webp"}
         from pathlib import Path
         ext = Path(file.filename).suffix.lower()
-        if ext not in allowed:
+        if ext not in AVATAR_EXTENSIONS:
             raise HTTPException(status_code=400, detail="Formato non supportato. Usa PNG/JPG/WEBP.")
         # sanitize filename
         base = Path(file.filename).stem
@@ -1363,9 +1367,11 @@ async def list_avatars():
         if not avatars_dir.exists():
             return {"avatars": []}
         items = []
-        for p in avatars_dir.iterdir():
-            if p.is_file() and p.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]:
-                items.append({"filename": p.name, "url": f"/static/avatars/{p.name}"})
+        # scandir riusa il d_type della directory: niente stat per ogni voce
+        with os.scandir(avatars_dir) as it:
+            for entry in it:
+                if os.path.splitext(entry.name)[1].lower() in AVATAR_EXTENSIONS and entry.is_file():
+                    items.append({"filename": entry.name, "url": f"/static/avatars/{entry.name}"})
         return {"avatars": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore elenco avatar: {str(e)}")
@@ -1411,7 +1417,7 @@ async def update_pipeline_config(cfg: PipelineConfig):
     for route in cfg.routes:
         pat = route.get("pattern", "")
         try:
-            re.compile(pat)
+            compile_pattern(pat)
         except re.error as e:
             invalid.append({"pattern": pat, "error": str(e)})
     if invalid:
@@ -1448,7 +1454,7 @@ async def add_pipeline_route(route: PipelineRoute):
     try:
         # Valida regex
         try:
-            re.compile(route.pattern)
+            compile_pattern(route.pattern)
         except re.error as e:
             raise HTTPException(status_code=400, detail=f"Pattern regex non valido: {str(e)}")
         
@@ -1479,7 +1485,7 @@ async def update_pipeline_route(update: RouteUpdate):
     try:
         # Valida regex
         try:
-            re.compile(update.new_pattern)
+            compile_pattern(update.new_pattern)
         except re.error as e:
             raise HTTPException(status_code=400, detail=f"Pattern regex non valido: {str(e)}")
         
@@ -2222,6 +2228,7 @@ async def admin_delete_user(user_id: int):
         
         conn.commit()
         conn.close()
+        invalidate_user_cache(user_id)
         
         return {"success": True, "message": f"Utente {user[0]} eliminato con successo"}
     except Exception as e:
@@ -2260,6 +2267,7 @@ async def admin_reset_user_password(user_id: int):
         )
         conn.commit()
         conn.close()
+        invalidate_user_cache(user_id)
 
         return {
             "success": True,
@@ -2295,6 +2303,7 @@ async def admin_change_user_role(user_id: int, request: UserRoleRequest):
         )
         conn.commit()
         conn.close()
+        invalidate_user_cache(user_id)
         
         role_name = "amministratore" if request.is_admin else "utente"
         return {
@@ -5,12 +5,13 @@ import jwt
 import bcrypt
 import secrets
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 import hashlib
 import os
+import time
 
 # Configuration
 # In sviluppo senza docker-compose vogliamo una chiave stabile anche senza variabile d'ambiente.
@@ -43,9 +44,32 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 MAX_LOGIN_ATTEMPTS = 5
 LOCKOUT_DURATION_MINUTES = 30
+def _env_seconds(name: str, default: float) -> float:
+    """Legge una durata in secondi dall'ambiente; valori non validi usano il default"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return max(float(raw), 0.0)
+    except ValueError:
+        print(f"[AUTH] Warning: invalid {name}={raw!r}, using {default}")
+        return default
+
+# Cache breve delle righe utente lette da get_current_user (0 = disattivata)
+USER_CACHE_TTL_SECONDS = _env_seconds("AUTH_USER_CACHE_TTL", 30.0)
+USER_CACHE_MAX_SIZE = 4096
 
 security = HTTPBearer()
 
+_user_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+def invalidate_user_cache(user_id: Optional[int] = None) -> None:
+    """Rimuove dalla cache un utente (o tutti): da chiamare dopo ogni UPDATE/DELETE su users"""
+    if user_id is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(user_id, None)
+
 # Pydantic models
 class UserRegistration(BaseModel):
     email: EmailStr
@@ -169,13 +193,25 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if token_data is None:
         raise credentials_exception
     
+    # Il token viene sempre verificato (firma e scadenza); la riga utente può
+    # arrivare dalla cache per USER_CACHE_TTL_SECONDS evitando una SELECT per richiesta
+    now = time.monotonic()
+    cached = _user_cache.get(token_data.user_id)
+    if cached is not None and cached[0] > now:
+        return dict(cached[1])
+    
     # Importa qui per evitare import circolari
     from .database import UserModel
     user = UserModel.get_user_by_id(token_data.user_id)
     if user is None:
+        _user_cache.pop(token_data.user_id, None)
         raise credentials_exception
     
-    return user
+    if USER_CACHE_TTL_SECONDS > 0:
+        if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+            _user_cache.pop(next(iter(_user_cache)), None)
+        _user_cache[token_data.user_id] = (now + USER_CACHE_TTL_SECONDS, user)
+    return dict(user)
 
 async def get_current_active_user(current_user: dict = Depends(get_current_user)):
     """Dependency per ottenere utente attivo"""
@@ -273,6 +309,7 @@ class EscrowManager:
                     WHERE email = ?
                 """, (new_password_hash, new_user_key_hash, target_email))
                 conn.commit()
+            invalidate_user_cache(user["id"])
             
             # Log azione
             AdminModel.log_admin_action(
@@ -11,7 +11,7 @@ from datetime import datetime, timedelta
 from .auth import (
     AuthManager, EscrowManager, UserRegistration, UserLogin, TokenResponse,
     get_current_user, get_current_active_user, get_current_admin_user, validate_password_strength, security, is_admin_user,
-    MAX_LOGIN_ATTEMPTS, LOCKOUT_DURATION_MINUTES
+    invalidate_user_cache, MAX_LOGIN_ATTEMPTS, LOCKOUT_DURATION_MINUTES
 )
 from .database import UserModel, AdminModel
 from .escrow import EscrowManager as EscrowManagerAdvanced
@@ -212,6 +212,7 @@ async def force_change_password(
                 WHERE id = ?
             """, (new_password_hash, new_user_key_hash, current_user["id"]))
             conn.commit()
+        invalidate_user_cache(current_user["id"])
         
         return {"message": "Password changed successfully"}
         
@@ -288,6 +289,7 @@ async def change_password(
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET must_change_password = 0 WHERE id = ?", (current_user["id"],))
             conn.commit()
+        invalidate_user_cache(current_user["id"])
         return {"message": "Password changed successfully"}
         
     except Exception as e:
@@ -365,6 +367,7 @@ async def update_user_role(user_id: int, payload: RoleUpdate, current_admin: dic
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET is_admin = ? WHERE id = ?", (1 if payload.is_admin else 0, user_id))
             conn.commit()
+        invalidate_user_cache(user_id)
         AdminModel.log_admin_action(current_admin.get("email","admin"), "UPDATE_ROLE", user_id, None, f"Set is_admin={payload.is_admin}")
         return {"success": True}
     except Exception as e:
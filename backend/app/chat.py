@@ -13,7 +13,7 @@ from .usage import log_usage
 from .admin import load_config
 from .memory import get_memory
 from .auth import get_current_active_user
-from .database import db_manager, MessageModel
+from .database import db_manager, MessageModel, new_id_hex
 from fastapi.responses import StreamingResponse
 import asyncio
 
@@ -142,8 +142,7 @@ async def chat(
     if conversation_id and current_user:
         try:
             # Genera ID unico per il messaggio utente
-            import uuid
-            user_message_id = f"msg_{uuid.uuid4().hex}"
+            user_message_id = f"msg_{new_id_hex()}"
             
             # Salva messaggio utente usando MessageModel
             # Usa la versione crittografata per il database
@@ -320,7 +319,7 @@ async def chat(
     if conversation_id and current_user:
         try:
             # Genera ID unico per il messaggio assistente
-            assistant_message_id = f"msg_{uuid.uuid4().hex}"
+            assistant_message_id = f"msg_{new_id_hex()}"
             
             # Calcola token per statistiche
             tokens_stats = compute_token_stats(messages, answer)
@@ -506,8 +505,7 @@ async def chat_stream(
     # Salvataggio messaggio utente (come nell'endpoint non streaming)
     if conversation_id and current_user:
         try:
-            import uuid
-            user_message_id = f"msg_{uuid.uuid4().hex}"
+            user_message_id = f"msg_{new_id_hex()}"
             success = MessageModel.add_message(
                 message_id=user_message_id,
                 conversation_id=conversation_id,
@@ -766,8 +764,7 @@ async def chat_stream(
                         pass
                 if conversation_id and current_user:
                     try:
-                        import uuid
-                        assistant_message_id = f"msg_{uuid.uuid4().hex}"
+                        assistant_message_id = f"msg_{new_id_hex()}"
                         success = MessageModel.add_message(
                             message_id=assistant_message_id,
                             conversation_id=conversation_id,
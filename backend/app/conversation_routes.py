@@ -2,21 +2,109 @@
 Conversation management endpoints with encryption support
 """
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import uuid
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple, Union
 from datetime import datetime
+from collections import OrderedDict
+import asyncio
 import hashlib
+import logging
+import os
 
 from .auth import get_current_active_user
-from .database import ConversationModel, MessageModel, DeviceModel
+from .database import ConversationModel, MessageModel, DeviceModel, ConversationSummaryModel, sha256_hex, new_id_hex
 from .prompts import load_summary_prompt
-from .llm import chat_with_provider
+from .llm import chat_with_provider, ProviderUnavailableError
 from .admin import get_summary_provider
-import io, json, zipfile
+import orjson
+import zipfile
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
+logger = logging.getLogger(__name__)
+
+# Gli endpoint che fanno solo accesso SQLite sono funzioni sincrone: FastAPI li esegue
+# nel threadpool, quindi le query non bloccano l'event loop. Gli endpoint async
+# (summary/export) delegano le letture al threadpool con run_in_threadpool.
+
+def _export_compresslevel(default: int = 6) -> int:
+    """Livello deflate da EXPORT_ZIP_COMPRESSLEVEL, riportato nell'intervallo 0-9.
+
+    Un valore non numerico usa il default e uno fuori intervallo viene limitato:
+    zlib lo rifiuterebbe solo a metà di un export già in streaming.
+    """
+    raw = os.getenv("EXPORT_ZIP_COMPRESSLEVEL")
+    if raw is None:
+        return default
+    try:
+        level = int(raw)
+    except ValueError:
+        logger.warning("Invalid EXPORT_ZIP_COMPRESSLEVEL=%r, using %d", raw, default)
+        return default
+    if not 0 <= level <= 9:
+        logger.warning("EXPORT_ZIP_COMPRESSLEVEL=%d out of range 0-9, clamping", level)
+    return min(max(level, 0), 9)
+
+# Livello deflate (0-9) per gli export ZIP: 1 per latenza minima, 9 per archivi più piccoli
+EXPORT_ZIP_COMPRESSLEVEL = _export_compresslevel()
+
+class _ZipChunkSink:
+    """Destinazione non seekable per ZipFile: raccoglie i byte scritti finché non vengono inviati"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(data if isinstance(data, bytes) else bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> List[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def _write_zip_member(zf: zipfile.ZipFile, sink: _ZipChunkSink, name: str,
+                      data: Union[str, bytes, Iterable[bytes]]) -> Iterator[bytes]:
+    """Scrive un membro nell'archivio e produce i byte compressi appena disponibili.
+
+    Su una destinazione non seekable ZipFile usa i data descriptor, quindi ogni
+    membro può essere inviato al client appena compresso. Un membro può essere
+    anche un iterabile di bytes, compresso e inviato man mano che viene prodotto.
+    """
+    if isinstance(data, (str, bytes)):
+        zf.writestr(name, data)
+    else:
+        with zf.open(name, 'w') as member:
+            for chunk in data:
+                member.write(chunk)
+                yield from sink.drain()
+    yield from sink.drain()
+
+def _iter_chat_json(conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """Serializza chat.json un messaggio alla volta.
+
+    L'output è identico a orjson.dumps({"conversation": ..., "messages": [...]},
+    option=OPT_INDENT_2), ma senza costruire la lista completa dei messaggi.
+    """
+    head = orjson.dumps({"conversation": conversation}, option=orjson.OPT_INDENT_2)
+    if not messages:
+        yield head[:-2] + b',\n  "messages": []\n}'
+        return
+    yield head[:-2] + b',\n  "messages": ['
+    sep = b'\n    '
+    for m in messages:
+        body = orjson.dumps({
+            "id": m['id'],
+            "role": m['role'],
+            "content": m['content_encrypted'],
+            "timestamp": m['timestamp']
+        }, option=orjson.OPT_INDENT_2)
+        yield sep + body.replace(b'\n', b'\n    ')
+        sep = b',\n    '
+    yield b'\n  ]\n}'
 
 # Pydantic models
 class ConversationCreate(BaseModel):
@@ -58,7 +146,7 @@ class ConversationSummaryResponse(BaseModel):
     generated_at: str
 
 @router.post("/", response_model=Dict[str, str])
-async def create_conversation(
+def create_conversation(
     conversation_data: ConversationCreate,
     current_user: dict = Depends(get_current_active_user)
 ):
@@ -66,7 +154,7 @@ async def create_conversation(
     
     try:
         # Genera ID unico conversazione
-        conversation_id = f"conv_{uuid.uuid4().hex}"
+        conversation_id = f"conv_{new_id_hex()}"
         
         # Crea conversazione nel database
         success = ConversationModel.create_conversation(
@@ -91,7 +179,7 @@ async def create_conversation(
         )
 
 @router.get("/", response_model=List[ConversationResponse])
-async def get_user_conversations(
+def get_user_conversations(
     limit: int = 50,
     current_user: dict = Depends(get_current_active_user)
 ):
@@ -103,7 +191,9 @@ async def get_user_conversations(
             limit=limit
         )
         
-        return [ConversationResponse(**conv) for conv in conversations]
+        # Righe con le sole colonne di ConversationResponse: la validazione la fa
+        # response_model, senza costruire un modello per riga qui
+        return conversations
         
     except Exception as e:
         raise HTTPException(
@@ -111,8 +201,113 @@ async def get_user_conversations(
             detail=f"Error retrieving conversations: {str(e)}"
         )
 
+# Device management endpoints
+@router.post("/devices/register")
+def register_device(
+    device_info: Dict[str, str],
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Registra dispositivo per sync"""
+    
+    required_fields = ["device_id", "device_name", "device_fingerprint"]
+    if not all(field in device_info for field in required_fields):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Missing required fields: {required_fields}"
+        )
+    
+    try:
+        success = DeviceModel.register_device(
+            device_id=device_info["device_id"],
+            user_id=current_user["id"],
+            device_name=device_info["device_name"],
+            device_fingerprint=device_info["device_fingerprint"],
+            user_agent=device_info.get("user_agent"),
+            ip=device_info.get("ip_address")
+        )
+        
+        if not success:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to register device"
+            )
+        
+        return {"message": "Device registered successfully"}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error registering device: {str(e)}"
+        )
+
+@router.get("/devices")
+def get_user_devices(
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Recupera dispositivi utente"""
+    
+    try:
+        devices = DeviceModel.get_user_devices(current_user["id"])
+        return {"devices": devices}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving devices: {str(e)}"
+        )
+
+# Statistics endpoint
+@router.get("/stats")
+def get_conversation_stats(
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Statistiche conversazioni utente"""
+    
+    try:
+        from .database import db_manager
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Totali dalla riga aggregata (mantenuta dai trigger) e conteggio per
+            # dispositivo dall'indice parziale sulle conversazioni attive
+            cursor.execute("""
+                SELECT 'total' AS kind, total_conversations AS n, total_messages,
+                       last_activity, NULL AS device_id
+                FROM user_conversation_stats
+                WHERE user_id = ?
+                UNION ALL
+                SELECT 'device', COUNT(*), NULL, NULL, device_id
+                FROM conversations
+                WHERE user_id = ? AND is_deleted = 0 AND device_id IS NOT NULL
+                GROUP BY device_id
+            """, (current_user["id"], current_user["id"]))
+            
+            stats: Dict[str, Any] = {"total_conversations": 0, "total_messages": 0, "last_activity": None}
+            device_stats = []
+            for row in cursor.fetchall():
+                if row["kind"] == "total":
+                    stats = {
+                        "total_conversations": row["n"],
+                        "total_messages": row["total_messages"],
+                        "last_activity": row["last_activity"],
+                    }
+                else:
+                    device_stats.append({"device_id": row["device_id"], "count": row["n"]})
+            
+            return {
+                "user_id": current_user["id"],
+                "statistics": stats,
+                "by_device": device_stats
+            }
+            
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving statistics: {str(e)}"
+        )
+
 @router.get("/{conversation_id}", response_model=ConversationResponse)
-async def get_conversation(
+def get_conversation(
     conversation_id: str,
     current_user: dict = Depends(get_current_active_user)
 ):
@@ -129,31 +324,19 @@ async def get_conversation(
             detail="Conversation not found"
         )
     
-    return ConversationResponse(**conversation)
+    return conversation
 
 @router.put("/{conversation_id}")
-async def update_conversation(
+def update_conversation(
     conversation_id: str,
     update_data: ConversationUpdate,
     current_user: dict = Depends(get_current_active_user)
 ):
     """Aggiorna titolo conversazione"""
     
-    # Verifica che conversazione appartenga all'utente
-    conversation = ConversationModel.get_conversation(
-        conversation_id=conversation_id,
-        user_id=current_user["id"]
-    )
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-    
     try:
-        # Aggiorna titolo
-        title_hash = hashlib.sha256(update_data.title_encrypted.encode()).hexdigest()
+        # Aggiorna titolo (la WHERE verifica anche che la conversazione appartenga all'utente)
+        title_hash = sha256_hex(update_data.title_encrypted)
         
         from .database import db_manager
         with db_manager.get_connection() as conn:
@@ -161,12 +344,21 @@ async def update_conversation(
             cursor.execute("""
                 UPDATE conversations 
                 SET title_encrypted = ?, title_hash = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ? AND user_id = ?
+                WHERE id = ? AND user_id = ? AND is_deleted = 0
             """, (update_data.title_encrypted, title_hash, conversation_id, current_user["id"]))
+            updated = cursor.rowcount > 0
             conn.commit()
         
+        if not updated:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        
         return {"message": "Conversation updated successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -174,42 +366,35 @@ async def update_conversation(
         )
 
 @router.delete("/{conversation_id}")
-async def delete_conversation(
+def delete_conversation(
     conversation_id: str,
     current_user: dict = Depends(get_current_active_user)
 ):
     """Elimina conversazione (soft delete)"""
     
-    # Verifica che conversazione appartenga all'utente
-    conversation = ConversationModel.get_conversation(
-        conversation_id=conversation_id,
-        user_id=current_user["id"]
-    )
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-    
     try:
         from .database import db_manager
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Soft delete conversazione e messaggi
+            # Soft delete conversazione (solo se appartiene all'utente): il trigger
+            # trg_conversations_soft_delete marca i messaggi nella stessa istruzione
             cursor.execute("""
-                UPDATE conversations SET is_deleted = 1 WHERE id = ? AND user_id = ?
+                UPDATE conversations SET is_deleted = 1 WHERE id = ? AND user_id = ? AND is_deleted = 0
             """, (conversation_id, current_user["id"]))
-            
-            cursor.execute("""
-                UPDATE messages SET is_deleted = 1 WHERE conversation_id = ?
-            """, (conversation_id,))
-            
+            deleted = cursor.rowcount > 0
             conn.commit()
         
+        if not deleted:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        
         return {"message": "Conversation deleted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -218,59 +403,43 @@ async def delete_conversation(
 
 # Message endpoints
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
-async def get_conversation_messages(
+def get_conversation_messages(
     conversation_id: str,
     limit: int = 100,
     current_user: dict = Depends(get_current_active_user)
 ):
     """Recupera messaggi di una conversazione"""
     
-    # Verifica che conversazione appartenga all'utente
-    conversation = ConversationModel.get_conversation(
-        conversation_id=conversation_id,
-        user_id=current_user["id"]
-    )
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-    
     try:
-        messages = MessageModel.get_conversation_messages(
+        # Verifica di appartenenza e lettura messaggi sulla stessa connessione
+        messages = MessageModel.get_user_conversation_messages(
             conversation_id=conversation_id,
+            user_id=current_user["id"],
             limit=limit
         )
-        
-        return [MessageResponse(**msg) for msg in messages]
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving messages: {str(e)}"
         )
+    
+    if messages is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    # Le righe hanno già le colonne di MessageResponse: validate da response_model
+    return messages
 
 @router.post("/{conversation_id}/messages", response_model=Dict[str, str])
-async def add_message(
+def add_message(
     conversation_id: str,
     message_data: MessageCreate,
     current_user: dict = Depends(get_current_active_user)
 ):
     """Aggiunge messaggio a conversazione"""
     
-    # Verifica che conversazione appartenga all'utente
-    conversation = ConversationModel.get_conversation(
-        conversation_id=conversation_id,
-        user_id=current_user["id"]
-    )
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-    
     # Valida role
     if message_data.role not in ['user', 'assistant']:
         raise HTTPException(
@@ -280,132 +449,35 @@ async def add_message(
     
     try:
         # Genera ID messaggio
-        message_id = f"msg_{uuid.uuid4().hex}"
+        message_id = f"msg_{new_id_hex()}"
         
-        # Aggiungi messaggio
-        success = MessageModel.add_message(
+        # Aggiungi messaggio (l'INSERT verifica che la conversazione appartenga all'utente)
+        inserted = MessageModel.add_user_message(
             message_id=message_id,
             conversation_id=conversation_id,
+            user_id=current_user["id"],
             content_encrypted=message_data.content_encrypted,
             role=message_data.role,
             token_count=message_data.token_count or 0,
             processing_time=message_data.processing_time or 0.0
         )
         
-        if not success:
+        if not inserted:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to add message"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
             )
         
         return {"message_id": message_id}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error adding message: {str(e)}"
         )
 
-# Device management endpoints
-@router.post("/devices/register")
-async def register_device(
-    device_info: Dict[str, str],
-    current_user: dict = Depends(get_current_active_user)
-):
-    """Registra dispositivo per sync"""
-    
-    required_fields = ["device_id", "device_name", "device_fingerprint"]
-    if not all(field in device_info for field in required_fields):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Missing required fields: {required_fields}"
-        )
-    
-    try:
-        success = DeviceModel.register_device(
-            device_id=device_info["device_id"],
-            user_id=current_user["id"],
-            device_name=device_info["device_name"],
-            device_fingerprint=device_info["device_fingerprint"],
-            user_agent=device_info.get("user_agent"),
-            ip=device_info.get("ip_address")
-        )
-        
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to register device"
-            )
-        
-        return {"message": "Device registered successfully"}
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error registering device: {str(e)}"
-        )
-
-@router.get("/devices")
-async def get_user_devices(
-    current_user: dict = Depends(get_current_active_user)
-):
-    """Recupera dispositivi utente"""
-    
-    try:
-        devices = DeviceModel.get_user_devices(current_user["id"])
-        return {"devices": devices}
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error retrieving devices: {str(e)}"
-        )
-
-# Statistics endpoint
-@router.get("/stats")
-async def get_conversation_stats(
-    current_user: dict = Depends(get_current_active_user)
-):
-    """Statistiche conversazioni utente"""
-    
-    try:
-        from .database import db_manager
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Conteggio conversazioni
-            cursor.execute("""
-                SELECT COUNT(*) as total_conversations,
-                       SUM(message_count) as total_messages,
-                       MAX(updated_at) as last_activity
-                FROM conversations 
-                WHERE user_id = ? AND is_deleted = 0
-            """, (current_user["id"],))
-            
-            stats = dict(cursor.fetchone())
-            
-            # Conversazioni per dispositivo
-            cursor.execute("""
-                SELECT device_id, COUNT(*) as count
-                FROM conversations 
-                WHERE user_id = ? AND is_deleted = 0 AND device_id IS NOT NULL
-                GROUP BY device_id
-            """, (current_user["id"],))
-            
-            device_stats = [dict(row) for row in cursor.fetchall()]
-            
-            return {
-                "user_id": current_user["id"],
-                "statistics": stats,
-                "by_device": device_stats
-            }
-            
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error retrieving statistics: {str(e)}"
-        )
-
 # Test endpoint for debugging authentication
 @router.get("/test-auth")
 async def test_auth(current_user: dict = Depends(get_current_active_user)):
@@ -418,28 +490,72 @@ async def test_auth(current_user: dict = Depends(get_current_active_user)):
     }
 
 # ---------------- Summary & Export with Report -----------------
-@router.get("/{conversation_id}/summary", response_model=ConversationSummaryResponse)
-async def summarize_conversation(
-    conversation_id: str,
-    current_user: dict = Depends(get_current_active_user)
-):
-    """Genera un riassunto della conversazione usando il prompt di summary configurato."""
-    conversation = ConversationModel.get_conversation(conversation_id, current_user["id"])
+# Cache LRU dei riassunti: la chiave include lo stato della conversazione
+# (updated_at, numero e ultimo messaggio) oltre a provider e prompt, quindi
+# qualsiasi nuovo messaggio o cambio di configurazione produce una nuova voce.
+# Sotto la cache in memoria c'è la tabella conversation_summaries, che
+# sopravvive ai riavvii ed è condivisa tra i worker.
+SUMMARY_CACHE_SIZE = 256
+SUMMARY_MESSAGE_LIMIT = 1000
+_summary_cache: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+
+def _load_conversation_for_summary(conversation_id: str, user_id: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Carica conversazione e messaggi per summary/export: 404 se non dell'utente, 400 se vuota"""
+    conversation = ConversationModel.get_conversation(conversation_id, user_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    messages = MessageModel.get_conversation_messages(conversation_id, limit=1000)
+    messages = MessageModel.get_conversation_messages(conversation_id, limit=SUMMARY_MESSAGE_LIMIT)
     if not messages:
         raise HTTPException(status_code=400, detail="Conversation has no messages")
+    return conversation, messages
 
-    # Genera summary con provider configurato
+async def _generate_summary(conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Ritorna (summary, provider), riusando un riassunto già generato se la conversazione non è cambiata"""
     summary_prompt = load_summary_prompt()
     summary_provider = get_summary_provider()
-    llm_messages = [{"role": "system", "content": summary_prompt}] + [
-        {"role": m['role'], "content": m['content_encrypted']} for m in messages
-    ]
+    cache_key = (
+        conversation['id'],
+        conversation['updated_at'],
+        len(messages),
+        messages[-1]['id'],
+        summary_provider,
+        hashlib.sha1(summary_prompt.encode('utf-8')).hexdigest(),
+    )
+    cached = _summary_cache.get(cache_key)
+    if cached is not None:
+        _summary_cache.move_to_end(cache_key)
+        return cached, summary_provider
+
+    state_key = sha256_hex("|".join(str(part) for part in cache_key[1:]))
+    summary_text = await run_in_threadpool(ConversationSummaryModel.get_summary, conversation['id'], state_key)
+    if summary_text is None:
+        llm_messages = [{"role": "system", "content": summary_prompt}] + [
+            {"role": m['role'], "content": m['content_encrypted']} for m in messages
+        ]
+        try:
+            summary_text = await chat_with_provider(llm_messages, provider=summary_provider, strict=True)
+        except ProviderUnavailableError:
+            # Provider non disponibile: risposta locale di ripiego, da non salvare né mettere in cache
+            return await chat_with_provider(llm_messages, provider="local"), summary_provider
+        await run_in_threadpool(ConversationSummaryModel.save_summary, conversation['id'], state_key, summary_text, summary_provider)
+
+    _summary_cache[cache_key] = summary_text
+    if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+        _summary_cache.popitem(last=False)
+    return summary_text, summary_provider
+
+@router.get("/{conversation_id}/summary", response_model=ConversationSummaryResponse)
+async def summarize_conversation(
+    conversation_id: str,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """Genera un riassunto della conversazione usando il prompt di summary configurato."""
+    conversation, messages = await run_in_threadpool(_load_conversation_for_summary, conversation_id, current_user["id"])
+
+    # Genera summary con provider configurato
     try:
-        summary_text = await chat_with_provider(llm_messages, provider=summary_provider)
+        summary_text, summary_provider = await _generate_summary(conversation, messages)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Summary generation failed: {e}")
 
@@ -462,75 +578,71 @@ async def export_conversation_with_report(
     - metadata.json (informazioni di export)
     """
     try:
-        conversation = ConversationModel.get_conversation(conversation_id, current_user['id'])
-        if not conversation:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Conversation {conversation_id} not found for user {current_user['id']}"
-            )
+        conversation, messages = await run_in_threadpool(_load_conversation_for_summary, conversation_id, current_user['id'])
 
-        messages = MessageModel.get_conversation_messages(conversation_id, limit=1000)
-        if not messages:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Conversation {conversation_id} has no messages to export"
-            )
+        conv_id = conversation['id']
+        conv_created = conversation['created_at']
+        conv_updated = conversation['updated_at']
+        n_messages = len(messages)
 
-        # Genera summary con error handling migliorato
-        summary_prompt = load_summary_prompt()
-        summary_provider = get_summary_provider()
-        llm_messages = [{"role": "system", "content": summary_prompt}] + [
-            {"role": m['role'], "content": m['content_encrypted']} for m in messages
-        ]
-        
-        try:
-            summary_text = await chat_with_provider(llm_messages, provider=summary_provider)
-        except Exception as e:
-            print(f"Summary generation failed for conversation {conversation_id}: {e}")
-            summary_text = f"Errore generazione summary: {e}\n\nConversazione con {len(messages)} messaggi dal {conversation['created_at']} al {conversation['updated_at']}"
-
-        # Preparazione payload export
-        chat_payload = {
-            "conversation": {
-                "id": conversation['id'],
-                "title_encrypted": conversation['title_encrypted'],
-                "created_at": conversation['created_at'],
-                "updated_at": conversation['updated_at'],
-                "message_count": conversation['message_count']
-            },
-            "messages": [
-                {
-                    "id": m['id'],
-                    "role": m['role'],
-                    "content": m['content_encrypted'],
-                    "timestamp": m['timestamp']
-                } for m in messages
-            ]
+        # Il riassunto (chiamata LLM) parte subito e procede mentre chat.json
+        # viene serializzato e inviato; report.md lo attende solo quando serve
+        summary_task = asyncio.create_task(_generate_summary(conversation, messages))
+
+        # Preparazione payload export: i messaggi vengono serializzati in streaming
+        chat_conversation = {
+            "id": conv_id,
+            "title_encrypted": conversation['title_encrypted'],
+            "created_at": conv_created,
+            "updated_at": conv_updated,
+            "message_count": conversation['message_count']
         }
         
-        report_md = f"# Report Conversazione {conversation['id']}\n\n## Informazioni Generali\n- Creata: {conversation['created_at']}\n- Ultimo aggiornamento: {conversation['updated_at']}\n- Numero messaggi: {len(messages)}\n\n## Riassunto\n\n{summary_text}\n"
-        
         metadata = {
             "exported_at": datetime.utcnow().isoformat() + 'Z',
             "user_id": current_user['id'],
             "conversation_id": conversation_id,
             "files": ["chat.json", "report.md", "metadata.json"],
-            "message_count": len(messages),
+            "message_count": n_messages,
             "export_version": "1.1"
         }
 
-        # Creazione ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('chat.json', json.dumps(chat_payload, ensure_ascii=False, indent=2))
-            zf.writestr('report.md', report_md)
-            zf.writestr('metadata.json', json.dumps(metadata, ensure_ascii=False, indent=2))
+        async def _export_stream():
+            sink = _ZipChunkSink()
+            try:
+                with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=EXPORT_ZIP_COMPRESSLEVEL) as zf:
+                    # chat.json è il membro più grande: compresso nel threadpool
+                    chat_chunks = _write_zip_member(zf, sink, 'chat.json', _iter_chat_json(chat_conversation, messages))
+                    try:
+                        async for chunk in iterate_in_threadpool(chat_chunks):
+                            yield chunk
+                    finally:
+                        # Su disconnessione chiude il membro aperto prima che si chiuda lo ZipFile
+                        chat_chunks.close()
+
+                    # Genera summary con error handling migliorato
+                    try:
+                        summary_text, _ = await summary_task
+                    except Exception as e:
+                        logger.warning("Summary generation failed for conversation %s: %s", conversation_id, e)
+                        summary_text = f"Errore generazione summary: {e}\n\nConversazione con {n_messages} messaggi dal {conv_created} al {conv_updated}"
+
+                    report_md = f"# Report Conversazione {conv_id}\n\n## Informazioni Generali\n- Creata: {conv_created}\n- Ultimo aggiornamento: {conv_updated}\n- Numero messaggi: {n_messages}\n\n## Riassunto\n\n{summary_text}\n"
+                    for chunk in _write_zip_member(zf, sink, 'report.md', report_md):
+                        yield chunk
+                    for chunk in _write_zip_member(zf, sink, 'metadata.json', orjson.dumps(metadata, option=orjson.OPT_INDENT_2)):
+                        yield chunk
+                for chunk in sink.drain():
+                    yield chunk
+            finally:
+                # Client disconnesso prima del report: la chiamata LLM non serve più
+                if not summary_task.done():
+                    summary_task.cancel()
 
-        zip_buffer.seek(0)
         filename = f"conversation_{conversation_id}_export.zip"
         
         return StreamingResponse(
-            zip_buffer, 
+            _export_stream(), 
             media_type='application/zip', 
             headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
@@ -539,7 +651,7 @@ async def export_conversation_with_report(
         # Re-raise HTTP exceptions as-is
         raise
     except Exception as e:
-        print(f"Unexpected error in export_conversation_with_report: {e}")
+        logger.exception("Unexpected error in export_conversation_with_report")
         raise HTTPException(
             status_code=500, 
             detail=f"Internal error during export: {str(e)}"
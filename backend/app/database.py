@@ -4,21 +4,70 @@ Database models and configuration for QSA Chatbot with encrypted conversations
 import sqlite3
 import hashlib
 import os
+import secrets
+import time
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import math
+import queue
 from pathlib import Path
 from contextlib import contextmanager
 
 # Configura il percorso del database nella nuova struttura
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATABASE_PATH = str(BASE_DIR / "storage" / "databases" / "qsa_chatbot.db")
+def _env_pool_size(default: int = 8) -> int:
+    """Legge DB_POOL_SIZE; un valore non numerico usa il default invece di bloccare l'avvio"""
+    raw = os.getenv("DB_POOL_SIZE")
+    if raw is None:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        print(f"[DB] Warning: invalid DB_POOL_SIZE={raw!r}, using {default}")
+        return default
+
+# Numero massimo di connessioni inattive mantenute aperte per il riuso (<= 0 disattiva il pool)
+DB_POOL_SIZE = _env_pool_size()
+
+# PRAGMA applicati ad ogni nuova connessione: WAL permette letture concorrenti
+# durante le scritture e synchronous=NORMAL evita un fsync per ogni commit
+# (sicuro in modalità WAL). La cache è per connessione, quindi resta contenuta.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+def sha256_hex(text: str) -> str:
+    """Hash SHA-256 esadecimale usato per title_hash/content_hash.
+
+    Deve restare SHA-256: la ricerca (search_routes) confronta queste colonne
+    con gli hash generati da chat.generate_search_hashes.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def new_id_hex() -> str:
+    """ID ordinato nel tempo: 48 bit di millisecondi + 80 bit casuali (32 caratteri hex).
+
+    Le nuove righe finiscono in coda al B-tree della chiave primaria invece che in
+    posizioni casuali, con meno page split e pagine calde in cache. Usato per gli
+    ID di conversazioni e messaggi (conv_/msg_).
+    """
+    return f"{int(time.time() * 1000) & 0xFFFFFFFFFFFF:012x}{secrets.token_hex(10)}"
 
 class DatabaseManager:
     """Gestisce la connessione e le operazioni sul database SQLite"""
     
-    def __init__(self, db_path: str = DATABASE_PATH):
+    def __init__(self, db_path: str = DATABASE_PATH, pool_size: int = DB_POOL_SIZE):
         self.db_path = db_path
+        # Pool LIFO: la connessione usata più di recente (cache più calda) esce per prima.
+        # Con pool_size <= 0 il pool è disabilitato (una connessione per richiesta)
+        self._pool: "Optional[queue.LifoQueue[sqlite3.Connection]]" = (
+            queue.LifoQueue(maxsize=pool_size) if pool_size > 0 else None
+        )
         # Ensure parent directory exists to avoid 'unable to open database file'
         try:
             Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
@@ -26,14 +75,44 @@ class DatabaseManager:
             print(f"[DB] Warning: cannot create database directory: {e}")
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Apre una nuova connessione (condivisibile tra thread, mai in uso concorrente)"""
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Permette accesso per nome colonna
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
     @contextmanager
     def get_connection(self):
-        """Context manager per gestire connessioni al database"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Permette accesso per nome colonna
+        """Context manager per gestire connessioni al database.
+
+        Le connessioni vengono riusate tramite un piccolo pool invece di essere
+        aperte e chiuse ad ogni richiesta; al rilascio ogni transazione non
+        committata viene annullata.
+        """
+        conn = None
+        if self._pool is not None:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                pass
+        if conn is None:
+            conn = self._connect()
         try:
             yield conn
         finally:
+            self._release(conn)
+
+    def _release(self, conn: sqlite3.Connection):
+        """Restituisce la connessione al pool (o la chiude se il pool è pieno/guasta/disabilitato)"""
+        if self._pool is None:
+            conn.close()
+            return
+        try:
+            conn.rollback()
+            self._pool.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
             conn.close()
     
     def init_database(self):
@@ -105,6 +184,19 @@ class DatabaseManager:
                 )
             """)
             
+            # Cache persistente dei riassunti: state_key identifica stato conversazione,
+            # provider e prompt con cui il riassunto è stato generato
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_summaries (
+                    conversation_id TEXT PRIMARY KEY,
+                    state_key TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    provider TEXT,
+                    generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+                )
+            """)
+            
             # Tabella dispositivi utente
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS user_devices (
@@ -139,12 +231,124 @@ class DatabaseManager:
             # Indici per performance
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations (user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_device_active ON conversations (user_id, device_id) WHERE is_deleted = 0")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+            # Indici parziali sulle righe attive: filtro e ordinamento delle liste senza sort
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_active ON conversations (user_id, updated_at DESC) WHERE is_deleted = 0")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_conv_active ON messages (conversation_id, timestamp) WHERE is_deleted = 0")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_user_id ON user_devices (user_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_fingerprint ON user_devices (device_fingerprint)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_admin_actions_timestamp ON admin_actions (timestamp DESC)")
 
+            # Soft delete a cascata: eliminare una conversazione marca anche i suoi messaggi
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_conversations_soft_delete
+                AFTER UPDATE OF is_deleted ON conversations
+                WHEN NEW.is_deleted = 1 AND OLD.is_deleted = 0
+                BEGIN
+                    UPDATE messages SET is_deleted = 1
+                    WHERE conversation_id = NEW.id AND is_deleted = 0;
+                END
+            """)
+
+            # I riassunti in cache seguono la conversazione: foreign_keys non è attivo,
+            # quindi ON DELETE CASCADE non scatta e la pulizia è affidata ai trigger
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_conversation_summaries_soft_delete
+                AFTER UPDATE OF is_deleted ON conversations
+                WHEN NEW.is_deleted = 1 AND OLD.is_deleted = 0
+                BEGIN
+                    DELETE FROM conversation_summaries WHERE conversation_id = NEW.id;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_conversation_summaries_delete
+                AFTER DELETE ON conversations
+                BEGIN
+                    DELETE FROM conversation_summaries WHERE conversation_id = OLD.id;
+                END
+            """)
+            # Rimuove riassunti orfani rimasti da database creati prima dei trigger
+            cursor.execute("""
+                DELETE FROM conversation_summaries
+                WHERE conversation_id NOT IN (SELECT id FROM conversations WHERE is_deleted = 0)
+            """)
+
+            # Aggregati per utente su conversazioni attive, mantenuti dai trigger a ogni scrittura
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_conversation_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    total_conversations INTEGER NOT NULL DEFAULT 0,
+                    total_messages INTEGER NOT NULL DEFAULT 0,
+                    last_activity TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+                )
+            """)
+            # Backfill per database esistenti (gli utenti già presenti sono aggiornati dai trigger)
+            cursor.execute("""
+                INSERT OR IGNORE INTO user_conversation_stats
+                (user_id, total_conversations, total_messages, last_activity)
+                SELECT user_id, COUNT(*), COALESCE(SUM(message_count), 0), MAX(updated_at)
+                FROM conversations WHERE is_deleted = 0
+                GROUP BY user_id
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_insert
+                AFTER INSERT ON conversations
+                WHEN NEW.is_deleted = 0
+                BEGIN
+                    INSERT OR IGNORE INTO user_conversation_stats (user_id) VALUES (NEW.user_id);
+                    UPDATE user_conversation_stats
+                    SET total_conversations = total_conversations + 1,
+                        total_messages = total_messages + COALESCE(NEW.message_count, 0),
+                        last_activity = MAX(COALESCE(last_activity, ''), NEW.updated_at)
+                    WHERE user_id = NEW.user_id;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_update
+                AFTER UPDATE OF is_deleted, message_count, updated_at ON conversations
+                WHEN OLD.is_deleted = 0 OR NEW.is_deleted = 0
+                BEGIN
+                    INSERT OR IGNORE INTO user_conversation_stats (user_id) VALUES (NEW.user_id);
+                    UPDATE user_conversation_stats
+                    SET total_conversations = total_conversations
+                            + (NEW.is_deleted = 0) - (OLD.is_deleted = 0),
+                        total_messages = total_messages
+                            + CASE WHEN NEW.is_deleted = 0 THEN COALESCE(NEW.message_count, 0) ELSE 0 END
+                            - CASE WHEN OLD.is_deleted = 0 THEN COALESCE(OLD.message_count, 0) ELSE 0 END,
+                        last_activity = CASE WHEN NEW.is_deleted = 0
+                            THEN MAX(COALESCE(last_activity, ''), NEW.updated_at)
+                            ELSE (SELECT MAX(updated_at) FROM conversations
+                                  WHERE user_id = NEW.user_id AND is_deleted = 0)
+                        END
+                    WHERE user_id = NEW.user_id;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_delete
+                AFTER DELETE ON conversations
+                WHEN OLD.is_deleted = 0
+                BEGIN
+                    UPDATE user_conversation_stats
+                    SET total_conversations = total_conversations - 1,
+                        total_messages = total_messages - COALESCE(OLD.message_count, 0),
+                        last_activity = (SELECT MAX(updated_at) FROM conversations
+                                         WHERE user_id = OLD.user_id AND is_deleted = 0)
+                    WHERE user_id = OLD.user_id;
+                END
+            """)
+            # foreign_keys non è attivo: la riga aggregata va rimossa insieme all'utente
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_user_stats_user_delete
+                AFTER DELETE ON users
+                BEGIN
+                    DELETE FROM user_conversation_stats WHERE user_id = OLD.id;
+                END
+            """)
+            cursor.execute("DELETE FROM user_conversation_stats WHERE user_id NOT IN (SELECT id FROM users)")
+
             # Tabella risposte survey anonime (non legata a user_id)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS survey_responses (
@@ -296,7 +500,7 @@ class ConversationModel:
     def create_conversation(conversation_id: str, user_id: int, title_encrypted: str, device_id: str = None) -> bool:
         """Crea una nuova conversazione"""
         try:
-            title_hash = hashlib.sha256(title_encrypted.encode()).hexdigest()
+            title_hash = sha256_hex(title_encrypted)
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -314,7 +518,9 @@ class ConversationModel:
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT * FROM conversations 
+                SELECT id, title_encrypted, title_hash, created_at, updated_at,
+                       message_count, device_id
+                FROM conversations 
                 WHERE user_id = ? AND is_deleted = 0
                 ORDER BY updated_at DESC
                 LIMIT ?
@@ -352,7 +558,7 @@ class MessageModel:
                    role: str, token_count: int = 0, processing_time: float = 0) -> bool:
         """Aggiunge un messaggio alla conversazione"""
         try:
-            content_hash = hashlib.sha256(content_encrypted.encode()).hexdigest()
+            content_hash = sha256_hex(content_encrypted)
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
@@ -376,6 +582,38 @@ class MessageModel:
         except sqlite3.Error:
             return False
     
+    @staticmethod
+    def add_user_message(message_id: str, conversation_id: str, user_id: int, content_encrypted: str,
+                         role: str, token_count: int = 0, processing_time: float = 0) -> bool:
+        """Aggiunge un messaggio solo se la conversazione esiste e appartiene all'utente.
+
+        Il controllo di appartenenza è nella stessa INSERT (nessuna SELECT preliminare).
+        Ritorna False se la conversazione non è stata trovata; gli errori SQLite vengono propagati.
+        """
+        content_hash = sha256_hex(content_encrypted)
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO messages (id, conversation_id, content_encrypted, content_hash,
+                                    role, token_count, processing_time)
+                SELECT ?, ?, ?, ?, ?, ?, ?
+                WHERE EXISTS (
+                    SELECT 1 FROM conversations WHERE id = ? AND user_id = ? AND is_deleted = 0
+                )
+            """, (message_id, conversation_id, content_encrypted, content_hash,
+                 role, token_count, processing_time, conversation_id, user_id))
+            if cursor.rowcount == 0:
+                return False
+            
+            cursor.execute("""
+                UPDATE conversations 
+                SET message_count = message_count + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (conversation_id,))
+            
+            conn.commit()
+            return True
+    
     @staticmethod
     def get_conversation_messages(conversation_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Recupera i messaggi di una conversazione"""
@@ -388,6 +626,66 @@ class MessageModel:
                 LIMIT ?
             """, (conversation_id, limit))
             return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def get_user_conversation_messages(conversation_id: str, user_id: int, limit: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """Recupera i messaggi verificando sulla stessa connessione che la conversazione sia dell'utente.
+
+        Ritorna None se la conversazione non esiste o non appartiene all'utente.
+        """
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            # Verifica di appartenenza separata (lookup per chiave primaria): il LIMIT
+            # si applica solo ai messaggi, quindi limit=0 dà una lista vuota e non un 404
+            cursor.execute("""
+                SELECT 1 FROM conversations
+                WHERE id = ? AND user_id = ? AND is_deleted = 0
+            """, (conversation_id, user_id))
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("""
+                SELECT id, content_encrypted, content_hash, role,
+                       timestamp, token_count, processing_time
+                FROM messages
+                WHERE conversation_id = ? AND is_deleted = 0
+                ORDER BY timestamp ASC
+                LIMIT ?
+            """, (conversation_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+class ConversationSummaryModel:
+    """Modello per la cache persistente dei riassunti di conversazione"""
+    
+    @staticmethod
+    def get_summary(conversation_id: str, state_key: str) -> Optional[str]:
+        """Ritorna il riassunto salvato se generato per lo stesso stato della conversazione"""
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT summary FROM conversation_summaries
+                    WHERE conversation_id = ? AND state_key = ?
+                """, (conversation_id, state_key))
+                row = cursor.fetchone()
+                return row["summary"] if row else None
+        except sqlite3.Error:
+            return None
+    
+    @staticmethod
+    def save_summary(conversation_id: str, state_key: str, summary: str, provider: str) -> bool:
+        """Salva (o sostituisce) il riassunto della conversazione"""
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT OR REPLACE INTO conversation_summaries
+                    (conversation_id, state_key, summary, provider)
+                    VALUES (?, ?, ?, ?)
+                """, (conversation_id, state_key, summary, provider))
+                conn.commit()
+                return True
+        except sqlite3.Error:
+            return False
 
 class DeviceModel:
     """Modello per gestire i dispositivi utente"""
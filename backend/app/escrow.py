@@ -237,7 +237,7 @@ class EscrowManager:
                 return None
             
             # Aggiorna database
-            from .auth import AuthManager
+            from .auth import AuthManager, invalidate_user_cache
             new_password_hash = AuthManager.hash_password(temp_password)
             
             from .database import db_manager
@@ -255,6 +255,7 @@ class EscrowManager:
                     target_email
                 ))
                 conn.commit()
+            invalidate_user_cache(user["id"])
             
             # Log successo
             AdminModel.log_admin_action(
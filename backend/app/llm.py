@@ -112,7 +112,22 @@ async def _local_reply(messages: List[Dict], context_hint: str) -> str:
     
     return "Che interessante! Per aiutarti al meglio, mi piacerebbe conoscere prima la tua impressione generale sul QSA. Poi, se vuoi, possiamo analizzare insieme i tuoi punteggi dei fattori cognitivi (C1–C7) e successivamente quelli affettivo-motivazionali (A1–A7)."
 
-async def chat_with_provider(messages: List[Dict], provider: str = "local", context_hint: str = "", model: Optional[str] = None, temperature: float = 0.3) -> str:
+class ProviderUnavailableError(RuntimeError):
+    """Il provider richiesto non ha prodotto una risposta (usata solo con strict=True)"""
+
+async def _fallback_reply(messages: List[Dict], context_hint: str, strict: bool) -> str:
+    """Fallback alla risposta locale; in modalità strict solleva invece l'errore"""
+    if strict:
+        raise ProviderUnavailableError("Provider non disponibile, nessuna risposta generata")
+    return await _local_reply(messages, context_hint)
+
+async def chat_with_provider(messages: List[Dict], provider: str = "local", context_hint: str = "", model: Optional[str] = None, temperature: float = 0.3, strict: bool = False) -> str:
+    """Invia i messaggi al provider scelto.
+
+    Se il provider non è configurato o fallisce si ripiega sulla risposta locale;
+    con strict=True viene invece sollevata ProviderUnavailableError, così il
+    chiamante può distinguere una risposta reale dal fallback.
+    """
     provider = (provider or 'local').lower()
     print(f"🤖 Provider selezionato: {provider}")
     
@@ -126,7 +141,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
         
         if not api_key:
             print("⚠️ GOOGLE_API_KEY non trovata, fallback a local")
-            return await _local_reply(messages, context_hint)
+            return await _fallback_reply(messages, context_hint, strict)
         
         try:
             # Combina tutti i messaggi in un singolo prompt per Gemini
@@ -145,7 +160,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
             
             if not r.is_success:
                 print(f"❌ Errore Gemini: {r.status_code} - {r.text}")
-                return await _local_reply(messages, context_hint)
+                return await _fallback_reply(messages, context_hint, strict)
             
             data = r.json()
             print(f"✅ Gemini risposta ricevuta")
@@ -153,7 +168,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
             
         except Exception as e:
             print(f"💥 Errore Gemini: {e}")
-            return await _local_reply(messages, context_hint)
+            return await _fallback_reply(messages, context_hint, strict)
 
     # Claude
     if provider == "claude" and os.getenv("ANTHROPIC_API_KEY"):
@@ -227,7 +242,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
         
         if not api_key:
             print("⚠️ OPENROUTER_API_KEY non trovata, fallback a local")
-            return await _local_reply(messages, context_hint)
+            return await _fallback_reply(messages, context_hint, strict)
         
         try:
             print(f"📤 Chiamata a OpenRouter")
@@ -250,7 +265,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
             
             if not r.is_success:
                 print(f"❌ Errore OpenRouter: {r.status_code} - {r.text}")
-                return await _local_reply(messages, context_hint)
+                return await _fallback_reply(messages, context_hint, strict)
             
             data = r.json()
             print(f"✅ OpenRouter risposta ricevuta")
@@ -258,7 +273,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
             
         except Exception as e:
             print(f"💥 Errore OpenRouter: {e}")
-            return await _local_reply(messages, context_hint)
+            return await _fallback_reply(messages, context_hint, strict)
 
     # Ollama (modelli locali)
     if provider == "ollama":
@@ -301,7 +316,7 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
                 # Se il modello non esiste, suggerisci il pull
                 if r.status_code == 404 and 'model' in r.text.lower():
                     print(f"💡 Suggerimento: esegui 'ollama pull {model_name}' sul server dove gira Ollama")
-                return await _local_reply(messages, context_hint)
+                return await _fallback_reply(messages, context_hint, strict)
 
             data = r.json()
             print(f"✅ Ollama risposta ricevuta")
@@ -310,10 +325,10 @@ async def chat_with_provider(messages: List[Dict], provider: str = "local", cont
         except Exception as e:
             print(f"💥 Errore Ollama: {e}")
             print("💡 Assicurati che Ollama sia in esecuzione: ollama serve")
-            return await _local_reply(messages, context_hint)
+            return await _fallback_reply(messages, context_hint, strict)
 
     # fallback
-    return await _local_reply(messages, context_hint)
+    return await _fallback_reply(messages, context_hint, strict)
 
 def compute_token_stats(messages: List[Dict], reply: str) -> Dict:
     in_total, per_msg = count_messages_tokens(messages)
@@ -1,6 +1,7 @@
 from pathlib import Path
 import json
 import re
+from functools import lru_cache
 from typing import Optional
 import shutil
 import logging
@@ -280,7 +281,10 @@ def load_summary_prompts() -> dict:
 def save_summary_prompts(data: dict) -> None:
     SUMMARY_RUNTIME_DIR.mkdir(parents=True, exist_ok=True)
     SUMMARY_PROMPTS_JSON.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+    # Ogni modifica passa da qui: il prompt attivo in cache va ricaricato
+    load_summary_prompt.cache_clear()
 
+@lru_cache(maxsize=1)
 def load_summary_prompt() -> str:
     data = load_summary_prompts()
     active = data.get('active_id', 'default')
@@ -2,7 +2,7 @@ import re
 import json
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Pattern
 
 CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "pipeline_config.json"
 
@@ -17,6 +17,13 @@ def load_routes() -> List[Tuple[str, str]]:
   except Exception:
     return []
 
+@lru_cache(maxsize=4096)
+def compile_pattern(pattern: str) -> Pattern[str]:
+  """Compila un pattern di route una sola volta e lo riusa tra le richieste.
+  Solleva re.error per pattern invalidi (che non vengono messi in cache).
+  """
+  return re.compile(pattern)
+
 def detect_topic(user_text: str, enabled_topics: Optional[List[str]] = None) -> Optional[str]:
   """Rileva il topic dal testo dell'utente
   
@@ -30,7 +37,7 @@ def detect_topic(user_text: str, enabled_topics: Optional[List[str]] = None) ->
   t = user_text.lower()
   for pat, topic in load_routes():
     try:
-      if re.search(pat, t):
+      if compile_pattern(pat).search(t):
         # Se sono specificati topic abilitati, controlla che il topic sia nella lista
         if enabled_topics is not None and topic not in enabled_topics:
           continue
@@ -0,0 +1,202 @@
+"""Test della cache utenti di get_current_user e della sua invalidazione"""
+import asyncio
+
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+
+import app.auth as auth
+import app.database as database
+from app.auth import AuthManager, EscrowManager, get_current_active_user, get_current_admin_user
+from app.database import DatabaseManager, UserModel
+
+OLD_PASSWORD = "VecchiaPass123!"
+NEW_PASSWORD = "NuovaPass456!"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "test.db"), pool_size=2)
+    monkeypatch.setattr(database, "db_manager", db)
+    monkeypatch.setattr(auth, "USER_CACHE_TTL_SECONDS", 30.0)
+    auth.invalidate_user_cache()
+    yield db
+    auth.invalidate_user_cache()
+
+
+def _create_user(email, password=OLD_PASSWORD):
+    user_id = UserModel.create_user(
+        email,
+        AuthManager.hash_password(password),
+        AuthManager.generate_user_key_hash(password, email),
+        "escrow",
+    )
+    assert user_id is not None
+    return user_id
+
+
+def _token(user_id):
+    return AuthManager.create_access_token({"sub": str(user_id)})
+
+
+def _current_user(user_id):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=_token(user_id))
+    return asyncio.run(auth.get_current_user(credentials))
+
+
+def _headers(user_id):
+    return {"Authorization": f"Bearer {_token(user_id)}"}
+
+
+def _probe_router():
+    probe = APIRouter()
+
+    @probe.get("/me")
+    async def me(user: dict = Depends(get_current_active_user)):
+        return {
+            "is_admin": bool(user.get("is_admin")),
+            "must_change_password": bool(user.get("must_change_password")),
+        }
+
+    @probe.get("/admin-only")
+    async def admin_only(user: dict = Depends(get_current_admin_user)):
+        return {"ok": True}
+
+    return probe
+
+
+def test_rows_are_cached_until_invalidated(db):
+    user_id = _create_user("utente@example.com")
+    assert _current_user(user_id)["is_admin"] == 0
+
+    with db.get_connection() as conn:
+        conn.execute("UPDATE users SET is_admin = 1 WHERE id = ?", (user_id,))
+        conn.commit()
+    # Senza invalidazione la riga arriva dalla cache
+    assert _current_user(user_id)["is_admin"] == 0
+
+    auth.invalidate_user_cache(user_id)
+    assert _current_user(user_id)["is_admin"] == 1
+
+
+def test_cached_row_is_a_copy(db):
+    user_id = _create_user("utente@example.com")
+    _current_user(user_id)["is_admin"] = 1
+    assert _current_user(user_id)["is_admin"] == 0
+
+
+def test_zero_ttl_disables_cache(db, monkeypatch):
+    monkeypatch.setattr(auth, "USER_CACHE_TTL_SECONDS", 0.0)
+    user_id = _create_user("utente@example.com")
+    _current_user(user_id)
+    assert auth._user_cache == {}
+
+
+def test_escrow_manager_reset_invalidates(db):
+    user_id = _create_user("utente@example.com")
+    _current_user(user_id)
+
+    assert EscrowManager.admin_reset_user_password(
+        "admin@qsa-chatbot.com", "utente@example.com", NEW_PASSWORD, "escrow"
+    )
+    assert AuthManager.verify_password(NEW_PASSWORD, _current_user(user_id)["password_hash"])
+
+
+def test_deleted_user_is_rejected_after_invalidation(db):
+    user_id = _create_user("utente@example.com")
+    _current_user(user_id)
+
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+    auth.invalidate_user_cache(user_id)
+    with pytest.raises(HTTPException) as exc:
+        _current_user(user_id)
+    assert exc.value.status_code == 401
+
+
+@pytest.fixture
+def auth_client(db):
+    pytest.importorskip("cryptography")  # richiesto da app.escrow, importato da auth_routes
+    from app.auth_routes import router as auth_router
+
+    api = FastAPI()
+    api.include_router(auth_router, prefix="/api")
+    api.include_router(_probe_router())
+    return TestClient(api)
+
+
+def test_role_change_is_seen_by_next_request(auth_client):
+    admin_id = _create_user("admin@qsa-chatbot.com")
+    user_id = _create_user("utente@example.com")
+    assert auth_client.get("/admin-only", headers=_headers(user_id)).status_code == 403
+
+    role_url = f"/api/auth/admin/users/{user_id}/role"
+    r = auth_client.post(role_url, json={"is_admin": True}, headers=_headers(admin_id))
+    assert r.status_code == 200
+    assert auth_client.get("/admin-only", headers=_headers(user_id)).status_code == 200
+
+    r = auth_client.post(role_url, json={"is_admin": False}, headers=_headers(admin_id))
+    assert r.status_code == 200
+    assert auth_client.get("/admin-only", headers=_headers(user_id)).status_code == 403
+
+
+def test_password_change_is_seen_by_next_request(auth_client):
+    user_id = _create_user("utente@example.com")
+    payload = {"current_password": OLD_PASSWORD, "new_password": NEW_PASSWORD}
+
+    r = auth_client.post("/api/auth/change-password", json=payload, headers=_headers(user_id))
+    assert r.status_code == 200
+    # Con una riga in cache non aggiornata la vecchia password sarebbe ancora accettata
+    r = auth_client.post("/api/auth/change-password", json=payload, headers=_headers(user_id))
+    assert r.status_code == 400
+
+
+def test_forced_password_change_clears_flag(auth_client, db):
+    user_id = _create_user("utente@example.com")
+    with db.get_connection() as conn:
+        conn.execute("UPDATE users SET must_change_password = 1 WHERE id = ?", (user_id,))
+        conn.commit()
+    assert auth_client.get("/me", headers=_headers(user_id)).json()["must_change_password"] is True
+
+    r = auth_client.post(
+        "/api/auth/force-change-password",
+        json={"new_password": NEW_PASSWORD},
+        headers=_headers(user_id),
+    )
+    assert r.status_code == 200
+    assert auth_client.get("/me", headers=_headers(user_id)).json()["must_change_password"] is False
+
+
+@pytest.fixture
+def admin_client(db, monkeypatch):
+    # app.admin importa il motore RAG (numpy, sentence-transformers, ...)
+    admin = pytest.importorskip("app.admin")
+
+    monkeypatch.setattr(admin, "DATABASE_PATH", db.db_path)
+    api = FastAPI()
+    api.include_router(admin.router, prefix="/api")
+    api.include_router(_probe_router())
+    return TestClient(api)
+
+
+def test_admin_panel_changes_are_seen_by_next_request(admin_client):
+    admin_id = _create_user("admin@qsa-chatbot.com")
+    user_id = _create_user("utente@example.com")
+    me = admin_client.get("/me", headers=_headers(user_id)).json()
+    assert me == {"is_admin": False, "must_change_password": False}
+
+    r = admin_client.put(
+        f"/api/admin/users/{user_id}/role", json={"is_admin": True}, headers=_headers(admin_id)
+    )
+    assert r.status_code == 200
+    assert admin_client.get("/admin-only", headers=_headers(user_id)).status_code == 200
+
+    r = admin_client.post(f"/api/admin/users/{user_id}/reset-password", headers=_headers(admin_id))
+    assert r.status_code == 200
+    assert admin_client.get("/me", headers=_headers(user_id)).json()["must_change_password"] is True
+
+    r = admin_client.delete(f"/api/admin/users/{user_id}", headers=_headers(admin_id))
+    assert r.status_code == 200
+    assert admin_client.get("/me", headers=_headers(user_id)).status_code == 401
@@ -0,0 +1,54 @@
+"""Test di MessageModel.get_user_conversation_messages"""
+import pytest
+
+import app.database as database
+from app.database import DatabaseManager, MessageModel
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "test.db"), pool_size=1)
+    monkeypatch.setattr(database, "db_manager", db)
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, user_key_hash, escrow_key_encrypted) "
+            "VALUES (?, ?, 'h', 'k', 'e')",
+            [(1, "a@example.com"), (2, "b@example.com")],
+        )
+        conn.execute(
+            "INSERT INTO conversations (id, user_id, title_encrypted, title_hash) "
+            "VALUES ('c1', 1, 't', 'h'), ('empty', 1, 't', 'h')"
+        )
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, content_encrypted, content_hash, role, "
+            "timestamp, is_deleted) VALUES (?, 'c1', ?, 'h', 'user', ?, ?)",
+            [
+                ("m1", "uno", "2024-01-01 10:00:00", 0),
+                ("m2", "due", "2024-01-01 10:01:00", 1),
+                ("m3", "tre", "2024-01-01 10:02:00", 0),
+            ],
+        )
+        conn.commit()
+    return db
+
+
+def test_returns_active_messages_in_order(db):
+    messages = MessageModel.get_user_conversation_messages("c1", user_id=1)
+    assert [m["id"] for m in messages] == ["m1", "m3"]
+
+
+def test_limit_applies_to_messages_only(db):
+    limited = MessageModel.get_user_conversation_messages("c1", 1, limit=1)
+    assert [m["id"] for m in limited] == ["m1"]
+    # limit=0 su una conversazione esistente: lista vuota, non "non trovata"
+    assert MessageModel.get_user_conversation_messages("c1", 1, limit=0) == []
+    assert MessageModel.get_user_conversation_messages("empty", 1) == []
+
+
+def test_missing_foreign_or_deleted_conversation_is_none(db):
+    assert MessageModel.get_user_conversation_messages("nope", 1) is None
+    assert MessageModel.get_user_conversation_messages("c1", 2) is None
+    with db.get_connection() as conn:
+        conn.execute("UPDATE conversations SET is_deleted = 1 WHERE id = 'c1'")
+        conn.commit()
+    assert MessageModel.get_user_conversation_messages("c1", 1) is None
@@ -0,0 +1,78 @@
+"""Test del pool di connessioni di DatabaseManager"""
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.database import DatabaseManager
+
+
+def _manager(tmp_path, pool_size):
+    return DatabaseManager(str(tmp_path / "test.db"), pool_size=pool_size)
+
+
+def test_release_rolls_back_uncommitted_work(tmp_path):
+    db = _manager(tmp_path, pool_size=1)
+    with db.get_connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+        first = conn
+
+    with db.get_connection() as conn:
+        # Stessa connessione riusata dal pool, senza la scrittura non committata
+        assert conn is first
+        assert conn.in_transaction is False
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_pool_keeps_at_most_pool_size_connections(tmp_path):
+    db = _manager(tmp_path, pool_size=2)
+    with db.get_connection(), db.get_connection(), db.get_connection():
+        pass
+    assert db._pool.qsize() == 2
+
+
+@pytest.mark.parametrize("pool_size", [0, -1])
+def test_non_positive_pool_size_disables_pooling(tmp_path, pool_size):
+    db = _manager(tmp_path, pool_size=pool_size)
+    assert db._pool is None
+
+    with db.get_connection() as conn:
+        conn.execute("SELECT 1")
+    # Senza pool la connessione viene chiusa al rilascio
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_concurrent_use_never_shares_a_connection(tmp_path):
+    db = _manager(tmp_path, pool_size=4)
+    with db.get_connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+
+    in_use = set()
+    lock = threading.Lock()
+    overlaps = []
+
+    def work(i):
+        with db.get_connection() as conn:
+            with lock:
+                if id(conn) in in_use:
+                    overlaps.append(i)
+                in_use.add(id(conn))
+            try:
+                conn.execute("INSERT INTO t VALUES (?)", (i,))
+                conn.commit()
+            finally:
+                with lock:
+                    in_use.discard(id(conn))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(work, range(400)))
+
+    assert overlaps == []
+    assert db._pool.qsize() <= 4
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 400
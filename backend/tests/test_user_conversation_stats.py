@@ -0,0 +1,142 @@
+"""Test dei trigger che mantengono user_conversation_stats"""
+import random
+
+import pytest
+
+from app.database import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "test.db"), pool_size=1)
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, password_hash, user_key_hash, escrow_key_encrypted) "
+            "VALUES (?, ?, 'h', 'k', 'e')",
+            [(1, "a@example.com"), (2, "b@example.com")],
+        )
+        conn.commit()
+    return db
+
+
+def _stats(conn):
+    return {
+        row["user_id"]: (row["total_conversations"], row["total_messages"], row["last_activity"])
+        for row in conn.execute("SELECT * FROM user_conversation_stats")
+        # Una riga azzerata equivale all'assenza di conversazioni attive
+        if row["total_conversations"] or row["total_messages"] or row["last_activity"]
+    }
+
+
+def _expected(conn):
+    return {
+        row[0]: (row[1], row[2], row[3])
+        for row in conn.execute("""
+            SELECT user_id, COUNT(*), COALESCE(SUM(message_count), 0), MAX(updated_at)
+            FROM conversations WHERE is_deleted = 0
+            GROUP BY user_id
+        """)
+    }
+
+
+def _insert(conn, conv_id, user_id, updated_at, message_count=0):
+    conn.execute(
+        "INSERT INTO conversations (id, user_id, title_encrypted, title_hash, updated_at, "
+        "message_count) VALUES (?, ?, 't', 'h', ?, ?)",
+        (conv_id, user_id, updated_at, message_count),
+    )
+
+
+def test_stats_follow_insert_soft_delete_undelete_and_delete(db):
+    with db.get_connection() as conn:
+        _insert(conn, "c1", 1, "2024-01-01 10:00:00", 2)
+        _insert(conn, "c2", 1, "2024-01-02 10:00:00", 3)
+        _insert(conn, "c3", 2, "2024-01-03 10:00:00")
+        assert _stats(conn) == _expected(conn)
+        assert _stats(conn)[1] == (2, 5, "2024-01-02 10:00:00")
+
+        # Nuovo messaggio: message_count e updated_at cambiano insieme
+        conn.execute(
+            "UPDATE conversations SET message_count = message_count + 1, "
+            "updated_at = '2024-01-04 10:00:00' WHERE id = 'c1'"
+        )
+        assert _stats(conn) == _expected(conn)
+
+        # Soft delete della conversazione più recente: last_activity ricalcolata
+        conn.execute("UPDATE conversations SET is_deleted = 1 WHERE id = 'c1'")
+        assert _stats(conn) == _expected(conn)
+        assert _stats(conn)[1] == (1, 3, "2024-01-02 10:00:00")
+
+        # Undelete
+        conn.execute("UPDATE conversations SET is_deleted = 0 WHERE id = 'c1'")
+        assert _stats(conn) == _expected(conn)
+
+        # Hard delete di una conversazione attiva e di una già eliminata
+        conn.execute("DELETE FROM conversations WHERE id = 'c2'")
+        conn.execute("UPDATE conversations SET is_deleted = 1 WHERE id = 'c3'")
+        conn.execute("DELETE FROM conversations WHERE id = 'c3'")
+        assert _stats(conn) == _expected(conn)
+        conn.commit()
+
+
+def test_stats_match_group_by_after_random_writes(db):
+    rng = random.Random(1234)
+    with db.get_connection() as conn:
+        ids = []
+        for step in range(500):
+            ts = f"2024-02-01 00:{step // 60:02d}:{step % 60:02d}"
+            op = rng.random()
+            if op < 0.35 or not ids:
+                conv_id = f"c{step}"
+                _insert(conn, conv_id, rng.choice([1, 2]), ts, rng.randint(0, 4))
+                ids.append(conv_id)
+            elif op < 0.6:
+                conn.execute(
+                    "UPDATE conversations SET message_count = message_count + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (ts, rng.choice(ids)),
+                )
+            elif op < 0.8:
+                conn.execute(
+                    "UPDATE conversations SET is_deleted = ? WHERE id = ?",
+                    (rng.choice([0, 1]), rng.choice(ids)),
+                )
+            else:
+                conv_id = rng.choice(ids)
+                ids.remove(conv_id)
+                conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+            assert _stats(conn) == _expected(conn), f"divergenza al passo {step}"
+        conn.commit()
+
+
+def test_stats_row_removed_with_user(db):
+    with db.get_connection() as conn:
+        _insert(conn, "c1", 1, "2024-01-01 10:00:00", 2)
+        # Stessa sequenza di admin_delete_user
+        conn.execute("DELETE FROM conversations WHERE user_id = 1")
+        conn.execute("DELETE FROM users WHERE id = 1")
+        conn.commit()
+        assert conn.execute(
+            "SELECT COUNT(*) FROM user_conversation_stats WHERE user_id = 1"
+        ).fetchone()[0] == 0
+
+
+def test_backfill_and_orphan_cleanup_on_init(tmp_path):
+    path = str(tmp_path / "test.db")
+    db = DatabaseManager(path, pool_size=1)
+    with db.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO users (id, email, password_hash, user_key_hash, escrow_key_encrypted) "
+            "VALUES (1, 'a@example.com', 'h', 'k', 'e')"
+        )
+        _insert(conn, "c1", 1, "2024-01-01 10:00:00", 4)
+        # Simula un database precedente ai trigger
+        conn.execute("DELETE FROM user_conversation_stats")
+        conn.execute(
+            "INSERT INTO user_conversation_stats (user_id, total_conversations) VALUES (99, 1)"
+        )
+        conn.commit()
+
+    db = DatabaseManager(path, pool_size=1)
+    with db.get_connection() as conn:
+        assert _stats(conn) == _expected(conn) == {1: (1, 4, "2024-01-01 10:00:00")}